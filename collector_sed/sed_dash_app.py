@@ -1,10 +1,20 @@
 # Import packages
+import functools
 import json
-from dash import Dash, html, dcc, Output, Input, State, callback, ctx
+import os
+import threading
+from pathlib import Path
+from dash import Dash, html, dcc, Output, Input, State, callback, ctx, no_update
 import dash_bootstrap_components as dbc
 import pandas as pd
 
-from collector_sed.sed_model import CollectorParams, SedCell, CollectionSection
+from collector_sed import sed_model
+from collector_sed.sed_model import (
+    CollectorParams,
+    SedCell,
+    CollectionSection,
+    plot_sections,
+)
 
 MAX_CELLS = 50
 CUT_DEPTH = 0.1
@@ -18,7 +28,9 @@ NUMBER_OF_CELLS = 50
 START_CELL = 20
 END_CELL = 30
 COLORBY = "name"
-EXTRA_CELLS = []
+EXTRA_CELLS = ()
+
+DEFAULT_FIG_CACHE = Path.home() / ".cache" / "collector_sed" / "default_fig.json"
 
 HELP_TEXT = """This app roughly simulates the action of the collector vehicle traversing the seafloor and redistributing sediment laterally along the seafloor. The view is a cross section of the seafloor with the collector vehicle moving into and out of the screen. Each "cell" is one collector track.
 
@@ -53,6 +65,91 @@ Settings:
 * Reset clicked cells - Reset any cells that have been clicked."""
 
 
+# Sections are reused between runs that share the same cells and
+# materials, and only the passes are re-run
+_SECTION_CACHE: dict[tuple, CollectionSection] = {}
+_SECTION_CACHE_SIZE = 8
+_SECTION_LOCK = threading.Lock()
+
+
+def _get_section(
+    cut_depth: float,
+    extra_settled_cut_depth: float,
+    proportion_up_riser: float,
+    left_right_ratio: float,
+    sed_settled_density: float,
+    sed_base_density: float,
+    sed_percent_to_settle: float,
+    number_of_cells: int,
+) -> CollectionSection:
+    key = (
+        number_of_cells,
+        cut_depth,
+        extra_settled_cut_depth,
+        left_right_ratio,
+        sed_settled_density,
+        sed_base_density,
+        sed_percent_to_settle,
+        proportion_up_riser,
+    )
+
+    cs = _SECTION_CACHE.pop(key, None)
+    if cs is None:
+        cp = CollectorParams(cut_depth, proportion_up_riser, extra_settled_cut_depth)
+        sc = SedCell(
+            left_right_ratio,
+            sed_settled_density,
+            sed_base_density,
+            sed_percent_to_settle,
+        )
+        cs = CollectionSection(sc, number_of_cells, cp)
+    else:
+        cs.reset()
+
+    # Re-insert so the least recently used section is evicted first
+    _SECTION_CACHE[key] = cs
+    if len(_SECTION_CACHE) > _SECTION_CACHE_SIZE:
+        del _SECTION_CACHE[next(iter(_SECTION_CACHE))]
+
+    return cs
+
+
+@functools.lru_cache(maxsize=32)
+def _simulate(
+    cut_depth: float,
+    extra_settled_cut_depth: float,
+    proportion_up_riser: float,
+    left_right_ratio: float,
+    sed_settled_density: float,
+    sed_base_density: float,
+    sed_percent_to_settle: float,
+    number_of_cells: int,
+    start: int,
+    stop: int,
+    extra_cells: tuple[int, ...],
+) -> pd.DataFrame:
+    # The model output does not depend on the colouring, so it is cached
+    # separately and colorby changes only redraw the figure. The sections
+    # are cached rather than the CollectionSection, which gets reused.
+    with _SECTION_LOCK:
+        cs = _get_section(
+            cut_depth,
+            extra_settled_cut_depth,
+            proportion_up_riser,
+            left_right_ratio,
+            sed_settled_density,
+            sed_base_density,
+            sed_percent_to_settle,
+            number_of_cells,
+        )
+        cs.run_model(start, stop, extra_cells=extra_cells)
+        return cs.get_sections()
+
+
+def _render(sections: pd.DataFrame, colorby: str):
+    return plot_sections(sections, color_by=colorby)
+
+
 def draw_fig(
     cut_depth: float = CUT_DEPTH,
     extra_settled_cut_depth: float = EXTRA_SETTLED_CUT_DEPTH,
@@ -65,21 +162,52 @@ def draw_fig(
     start: int = START_CELL,
     stop: int = END_CELL,
     colorby: str = COLORBY,
-    extra_cells: list[int] = EXTRA_CELLS,
+    extra_cells: tuple[int, ...] = EXTRA_CELLS,
 ):
-    cp = CollectorParams(cut_depth, proportion_up_riser, extra_settled_cut_depth)
-    sc = SedCell(
+    sections = _simulate(
+        cut_depth,
+        extra_settled_cut_depth,
+        proportion_up_riser,
         left_right_ratio,
         sed_settled_density,
         sed_base_density,
         sed_percent_to_settle,
+        number_of_cells,
+        start,
+        stop,
+        tuple(extra_cells),
     )
-    cs = CollectionSection(sc, number_of_cells, cp)
+    return _render(sections, colorby)
+
+
+def _load_or_compute_default_fig():
+    # The default figure only depends on the code, so reuse the copy saved
+    # on disk unless the model or the defaults changed after it was written
+    sources = [Path(sed_model.__file__), Path(__file__)]
+    try:
+        cache_mtime = DEFAULT_FIG_CACHE.stat().st_mtime
+        if cache_mtime >= max(p.stat().st_mtime for p in sources):
+            return json.loads(DEFAULT_FIG_CACHE.read_text())
+    except (OSError, ValueError):
+        pass
+
+    fig = draw_fig()
+
+    # Write to a temporary file first so other workers never read a
+    # partial figure
+    tmp_path = DEFAULT_FIG_CACHE.with_suffix(f".{os.getpid()}.tmp")
+    try:
+        DEFAULT_FIG_CACHE.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path.write_text(fig.to_json())
+        os.replace(tmp_path, DEFAULT_FIG_CACHE)
+    except OSError:
+        pass
 
-    cs.run_model(start, stop, extra_cells=extra_cells)
-    return cs.get_plotly_graph(color_by=colorby)
+    return fig
 
 
+_INITIAL_FIG = _load_or_compute_default_fig()
+
 # Initialize the app
 app = Dash(external_stylesheets=[dbc.themes.BOOTSTRAP])
 
@@ -231,7 +359,7 @@ controls = [
     ),
 ]
 
-graph = dbc.Col([html.Div(dcc.Graph(figure=draw_fig(), id="graph"))])
+graph = dbc.Col([html.Div(dcc.Graph(figure=_INITIAL_FIG, id="graph"))])
 
 app.layout = [dbc.Container([dbc.Row(controls), dbc.Row(graph)], fluid=True)]
 
@@ -243,7 +371,6 @@ app.layout = [dbc.Container([dbc.Row(controls), dbc.Row(graph)], fluid=True)]
     Input("reset-extra", "n_clicks"),
     Input("graph", "clickData"),
     State("data-store", "data"),
-    State("graph", "figure"),
     State("cut-depth-slider", "value"),
     State("cut-depth-extra-slider", "value"),
     State("left-right-slider", "value"),
@@ -262,7 +389,6 @@ def make_graph(
     __,
     graph_click_data,
     datastore,
-    old_fig,
     cut_depth,
     cut_depth_extra,
     left_right_ratio,
@@ -275,14 +401,17 @@ def make_graph(
     stop,
     colorby,
 ):
-    if datastore is not None:
-        labels = json.loads(datastore)
-    else:
-        labels = []
+    # The store holds the clicked cells as a plain list, in click order,
+    # which Dash already serialises for us. Sessions from before this still
+    # hold a JSON string, start those again with no extra cells.
+    labels = list(datastore) if isinstance(datastore, list) else []
 
     if ctx.triggered_id == "graph" and graph_click_data is not None:
-        labels.append(graph_click_data["points"][0]["label"])
-        # labels = list(set(labels))
+        label = graph_click_data["points"][0]["label"]
+        # Clicking a cell that is already included leaves the graph as is
+        if label in labels:
+            return no_update, no_update
+        labels.append(label)
 
     if ctx.triggered_id == "reset-extra":
         labels = []
@@ -299,23 +428,26 @@ def make_graph(
         start=start,
         stop=stop,
         colorby=colorby,
-        extra_cells=labels,
+        extra_cells=tuple(labels),
     )
 
-    fig["layout"] = old_fig["layout"]
-
-    return json.dumps(labels), fig
+    return labels, fig
 
 
-@app.callback(
+# Toggling the help modal is handled in the browser
+app.clientside_callback(
+    """
+    function(n1, n2, is_open) {
+        if (n1 || n2) {
+            return !is_open;
+        }
+        return is_open;
+    }
+    """,
     Output("modal", "is_open"),
     [Input("open", "n_clicks"), Input("close", "n_clicks")],
     [State("modal", "is_open")],
 )
-def toggle_modal(n1, n2, is_open):
-    if n1 or n2:
-        return not is_open
-    return is_open
 
 
 # Run the app
@@ -1,59 +1,191 @@
-import copy
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, replace
+from itertools import chain
 from typing import List, Literal, Tuple
 
+import numpy as np
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
+from numba import njit
 
 BED_BOTTOM = -0.2
 
-def cut_settled_only(
-    bed_layers: pd.DataFrame, cut_depth: float
-) -> Tuple[pd.DataFrame, float]:
-    settled_layers = bed_layers[bed_layers["type"] == "settled"]
-    bed = bed_layers[bed_layers["type"] == "bed"]
+# Pass names and origin cells are numbers, layers that did not come from a
+# collector pass (the original bed) have NaN for both
+NO_VALUE = float("nan")
+
+# Layer types are stored as codes into LAYER_TYPES. The row left when a cut
+# goes right through the bed has no type, which from_codes shows as NaN.
+TYPE_NONE = -1
+TYPE_BED = 0
+TYPE_SETTLED = 1
+LAYER_TYPES = ["bed", "settled"]
+
+# customdata holds the name, thickness and total thickness set in
+# plot_sections
+HOVERTEMPLATE = (
+    "<b>Cell: %{x}</b><br><br>"
+    "Name=%{customdata[0]:.3f}<br>"
+    "Top=%{y:.3f}<br>"
+    "Bottom=%{base:.3f}<br>"
+    "Thickness: %{customdata[1]:.3f}<br>"
+    "Total thickness: %{customdata[2]:.3f}<br>"
+    "<extra></extra>"
+)
+
+
+@njit(cache=True)
+def drain_sediment(
+    pass_left: np.ndarray,
+    pass_right: np.ndarray,
+    origin_cell: int,
+    percent_to_settle: float,
+    mass_lower_limit: float,
+    event_cells: np.ndarray,
+    event_mass: np.ndarray,
+) -> int:
+    # Pass sediment from origin_cell out to its neighbours until what is
+    # left drops below the lower limit or leaves the section. Each time
+    # sediment settles, the cell and mass are written to event_cells and
+    # event_mass and the number of events is returned.
+    #
+    # Only the cells the sediment reaches are visited, rather than sweeping
+    # the whole section until nothing moves. A cell is given sediment at
+    # most once per drain, so arrays the length of the section are enough.
+    n = pass_left.shape[0]
+    n_events = 0
+
+    i = origin_cell
+    while pass_left[i] > mass_lower_limit:
+        mass = pass_left[i]
+        pass_left[i] = 0.0
+        if i == 0:
+            break
+
+        mass_to_settle = mass * percent_to_settle
+        event_cells[n_events] = i - 1
+        event_mass[n_events] = mass_to_settle
+        n_events += 1
+        pass_left[i - 1] = mass - mass_to_settle
+        i -= 1
+
+    i = origin_cell
+    while pass_right[i] > mass_lower_limit:
+        mass = pass_right[i]
+        pass_right[i] = 0.0
+        if i == n - 1:
+            break
+
+        mass_to_settle = mass * percent_to_settle
+        event_cells[n_events] = i + 1
+        event_mass[n_events] = mass_to_settle
+        n_events += 1
+        pass_right[i + 1] = mass - mass_to_settle
+        i += 1
+
+    return n_events
 
-    if settled_layers.empty:
-        return bed_layers, 0.0
 
-    absolute_cut = settled_layers["top"].max() - cut_depth
-    df_partial_cut = settled_layers[settled_layers["bottom"] < absolute_cut]
-    df_partial_cut.reset_index(inplace=True, drop=True)
-    if not df_partial_cut.empty:
-        df_partial_cut.loc[0, "top"] = absolute_cut
+@dataclass
+class BedLayerLog:
+    # Layers from the top down, with one entry per layer in each list. This
+    # is the state the simulation works on, frames are only made for output.
+    tops: List[float] = field(default_factory=list)
+    bottoms: List[float] = field(default_factory=list)
+    types: List[int] = field(default_factory=list)
+    # Whole numbers, or NO_VALUE for layers not made by a collector pass
+    names: List[float] = field(default_factory=list)
+    origin_cells: List[float] = field(default_factory=list)
+
+    def add_top(
+        self, top: float, bottom: float, type: int, name: float, origin_cell: float
+    ):
+        self.tops.insert(0, top)
+        self.bottoms.insert(0, bottom)
+        self.types.insert(0, type)
+        self.names.insert(0, name)
+        self.origin_cells.insert(0, origin_cell)
+
+    def keep(self, indices: List[int]):
+        self.tops = [self.tops[i] for i in indices]
+        self.bottoms = [self.bottoms[i] for i in indices]
+        self.types = [self.types[i] for i in indices]
+        self.names = [self.names[i] for i in indices]
+        self.origin_cells = [self.origin_cells[i] for i in indices]
+
+    def to_dataframe(self) -> pd.DataFrame:
+        return pd.DataFrame(
+            {
+                "top": self.tops,
+                "bottom": self.bottoms,
+                "type": pd.Categorical.from_codes(self.types, LAYER_TYPES),
+                "name": self.names,
+                "origin_cell": self.origin_cells,
+            }
+        )
+
 
-    final_bedlayers = pd.concat([df_partial_cut, bed], ignore_index=True)
+def cut_settled_only(layers: BedLayerLog, cut_depth: float) -> float:
+    settled = []
+    below = []
+    for i, t in enumerate(layers.types):
+        if t == TYPE_SETTLED:
+            settled.append(i)
+        elif t == TYPE_BED:
+            below.append(i)
 
-    settled_cut = abs(bed_layers["top"].values[0] - final_bedlayers["top"].values[0])
+    if not settled:
+        return 0.0
 
-    return final_bedlayers, settled_cut
+    old_top = layers.tops[0]
+
+    # Settled layers are added on top, so the first one is the highest
+    absolute_cut = layers.tops[settled[0]] - cut_depth
+    partial_cut = [i for i in settled if layers.bottoms[i] < absolute_cut]
+
+    layers.keep(partial_cut + below)
+    if partial_cut:
+        layers.tops[0] = absolute_cut
+
+    settled_cut = abs(old_top - layers.tops[0])
+
+    return settled_cut
 
 
 def cut_sedbed(
-    bed_layers: pd.DataFrame, cut_depth: float, cut_extra_settled: float = None
-) -> Tuple[pd.DataFrame, float, float]:
+    layers: BedLayerLog, cut_depth: float, cut_extra_settled: float = None
+) -> Tuple[float, float]:
+    old_bottom_top = layers.tops[-1]
+
+    # Common case of the first pass over a cell: only the original bed is
+    # there and the cut stays within it, so there is nothing to filter
+    if len(layers.tops) == 1 and layers.types[0] == TYPE_BED:
+        absolute_cut = old_bottom_top - cut_depth
+        if layers.bottoms[0] < absolute_cut:
+            layers.tops[0] = absolute_cut
+            cut_bed = abs(absolute_cut - old_bottom_top)
+            return cut_bed, cut_depth - cut_bed
+
     if cut_extra_settled is not None:
-        precut_bed_layers, cut_settled = cut_settled_only(bed_layers, cut_extra_settled)
+        cut_settled = cut_settled_only(layers, cut_extra_settled)
     else:
         cut_settled = 0.0
-        precut_bed_layers = bed_layers
 
-    # Cut into the bed dataframe
-    absolute_cut = precut_bed_layers["top"].max() - cut_depth
+    # Cut into the bed layers, the first of which is always the highest
+    absolute_cut = layers.tops[0] - cut_depth
 
-    # df_cut_complete = self.bed_layers[self.bed_layers['bottom'] >= absolute_cut]
-    df_partial_cut = precut_bed_layers[precut_bed_layers["bottom"] < absolute_cut]
-    df_partial_cut.reset_index(inplace=True, drop=True)
-    df_partial_cut.loc[0, "top"] = absolute_cut
-    new_bed_layers = df_partial_cut
-
-    # compare = bed_layers.compare(new_bed_layers)
+    partial_cut = [i for i, b in enumerate(layers.bottoms) if b < absolute_cut]
+    layers.keep(partial_cut)
+    if partial_cut:
+        layers.tops[0] = absolute_cut
+    else:
+        # Cut right through the bed, leave just the new top
+        layers.add_top(absolute_cut, NO_VALUE, TYPE_NONE, NO_VALUE, NO_VALUE)
 
-    cut_bed = abs(new_bed_layers["top"].values[-1] - bed_layers["top"].values[-1])
+    cut_bed = abs(layers.tops[-1] - old_bottom_top)
     cut_settled += cut_depth - cut_bed
 
-    return new_bed_layers, cut_bed, cut_settled
+    return cut_bed, cut_settled
 
 
 @dataclass
@@ -61,45 +193,47 @@ class SedimentBed:
     bed_top: float = 0.0
     bed_bottom: float = BED_BOTTOM
     settled_top: float = 0.0
-    bed_layers: pd.DataFrame = field(default_factory=pd.DataFrame)
+    # Set by __post_init__ from the bed extent, so no placeholder is made
+    layers: BedLayerLog = field(init=False)
+    # The settled_top the bed was made with, for reset and fresh_copy
+    _initial_settled_top: float = field(init=False, repr=False)
 
     def __post_init__(self):
-        self.bed_layers = pd.DataFrame(
-            {
-                "top": [self.bed_top],
-                "bottom": [self.bed_bottom],
-                "type": ["bed"],
-                "name": ["existing"],
-                "origin_cell": [None],
-            }
+        self._initial_settled_top = self.settled_top
+        self._set_initial_layers()
+
+    def fresh_copy(self) -> "SedimentBed":
+        # A new uncut bed with the same extent, cheaper than a deepcopy.
+        # The layers are not an init field, so __post_init__ starts them
+        # again from the bed.
+        return replace(self, settled_top=self._initial_settled_top)
+
+    def reset(self):
+        # Go back to the bed as it was made, the same as a fresh_copy
+        self.settled_top = self._initial_settled_top
+        self._set_initial_layers()
+
+    def _set_initial_layers(self):
+        self.layers = BedLayerLog(
+            [self.bed_top], [self.bed_bottom], [TYPE_BED], [NO_VALUE], [NO_VALUE]
         )
 
+    def to_dataframe(self) -> pd.DataFrame:
+        return self.layers.to_dataframe()
+
     def cut(
         self, cut_depth: float, cut_extra_settled: float = None
     ) -> Tuple[float, float]:
-        new_bed_layers, cut_bed, cut_settled = cut_sedbed(
-            self.bed_layers, cut_depth, cut_extra_settled
-        )
-        self.bed_layers = new_bed_layers
-
-        return cut_bed, cut_settled
+        return cut_sedbed(self.layers, cut_depth, cut_extra_settled)
 
-    def settle(self, settle_thickness, name: str, origin_cell: int):
+    def settle(self, settle_thickness, name: int, origin_cell: int):
         self.settled_top += settle_thickness
 
-        current_top = self.bed_layers["top"].max()
+        # Layers are stored from the top down, so the first is the highest
+        current_top = self.layers.tops[0]
         new_top = current_top + settle_thickness
 
-        new_layer = pd.DataFrame(
-            {
-                "top": [new_top],
-                "bottom": [current_top],
-                "type": ["settled"],
-                "name": [name],
-                "origin_cell": [origin_cell],
-            }
-        )
-        self.bed_layers = pd.concat([new_layer, self.bed_layers], ignore_index=True)
+        self.layers.add_top(new_top, current_top, TYPE_SETTLED, name, origin_cell)
 
 
 @dataclass
@@ -112,6 +246,7 @@ class CollectorParams:
 
 @dataclass
 class SedCell:
+    # Sediment properties shared by every cell in a section
     # variable
     left_right_ratio: float
     sed_settled_density: float
@@ -122,58 +257,43 @@ class SedCell:
     # incoming
     # incoming_mass: float = None
 
-    # outgoing
-    sed_to_pass_left: float = 0.0
-    sed_to_pass_right: float = 0.0
-
-    # state
+    # state each cell's bed starts from
     sediment_bed: SedimentBed = field(default_factory=SedimentBed)
 
-    def apply_collector(self, cv: CollectorParams, pass_name: str, origin_cell: int):
-        mass_collected_pre_riser = self._get_sediment_mass(cv)
-
-        # Take away proportion for the riser
-        mass_collected = mass_collected_pre_riser * (1 - cv.proportion_up_riser)
-        
-        # Don't forget to settle some ON this cell
-        mass_to_settle = mass_collected * self.sed_percent_to_settle
-        self._settle(mass_to_settle, pass_name, origin_cell)
-
-        mass_to_pass = mass_collected - mass_to_settle
-        self.sed_to_pass_left = mass_to_pass * self.left_right_ratio
-        self.sed_to_pass_right = mass_to_pass - self.sed_to_pass_left
-
-    def add_sediment(
-        self, incoming_mass: float, direction: str, pass_name: str, origin_cell: int
-    ):
-        mass_to_settle = incoming_mass * self.sed_percent_to_settle
-        self._settle(mass_to_settle, pass_name, origin_cell)
-
-        if direction == "left":
-            self.sed_to_pass_left = incoming_mass - mass_to_settle
-        elif direction == "right":
-            self.sed_to_pass_right = incoming_mass - mass_to_settle
-        else:
-            raise ValueError(f"Unknown direction: {direction}")
-
-    def _settle(self, mass: float, name: str, origin_cell: int):
-        settled_thickness = mass / self.sed_settled_density
-        self.sediment_bed.settle(settled_thickness, name, origin_cell)
 
-    def _get_sediment_mass(self, cv: CollectorParams):
-        # Get sediment mass taken by collector
-
-        # First get from the settled
+def plot_sections(
+    df: pd.DataFrame, color_by: Literal["name", "proximity"]
+) -> go.Figure:
+    # Draw the output of CollectionSection.get_sections. The frame passed in
+    # is not modified, so it can be kept and drawn again.
+
+    if not color_by in ["name", "proximity"]:
+        raise ValueError("Unknown color by variable")
+
+    fig = px.bar(
+        df,
+        x="cell_number",
+        y="thickness",
+        base="bottom",
+        color=color_by,
+        # px takes the bar's own thickness for y, so pass it back in through
+        # custom_data to show it in the hover
+        custom_data=["name", "thickness", "total_thickness"],
+    )
+    fig.update_layout(
+        bargap=0.0,
+        coloraxis_colorbar=dict(
+            title=color_by,
+        ),
+        # A constant uirevision lets the browser keep the user's zoom and pan
+        # when the graph is redrawn with new results
+        uirevision="sections",
+    )
+    fig.update_traces(hovertemplate=HOVERTEMPLATE)
 
-        cut_bed, cut_settled = self.sediment_bed.cut(
-            cv.cut_depth, cv.extra_settled_cut_depth
-        )
+    fig.data[0].marker.line.width = 0
 
-        total_mass = (cut_settled * self.sed_settled_density) + (
-            cut_bed * self.sed_base_density
-        )
-
-        return total_mass
+    return fig
 
 
 @dataclass
@@ -181,13 +301,31 @@ class CollectionSection:
     seed_cell: SedCell
     number_of_cells: int
     collector: CollectorParams
-    cells: List[SedCell] = field(default_factory=list)
+    beds: List[SedimentBed] = field(default_factory=list)
     mass_lower_limit: float = 0.01
 
     def __post_init__(self):
-        self.cells = []
-        for _ in range(self.number_of_cells):
-            self.cells.append(copy.deepcopy(self.seed_cell))
+        # Per cell state is held as one bed per cell plus arrays of the
+        # sediment in transit, with the sediment properties taken from
+        # seed_cell
+        self.beds = [
+            self.seed_cell.sediment_bed.fresh_copy()
+            for _ in range(self.number_of_cells)
+        ]
+
+        self._pass_left = np.zeros(self.number_of_cells)
+        self._pass_right = np.zeros(self.number_of_cells)
+        self._event_cells = np.zeros(self.number_of_cells, dtype=np.int64)
+        self._event_mass = np.zeros(self.number_of_cells)
+
+    def reset(self):
+        # Clear the results of any previous run so the section can be run
+        # again without being rebuilt
+        for bed in self.beds:
+            bed.reset()
+
+        self._pass_left[:] = 0.0
+        self._pass_right[:] = 0.0
 
     def run_model(
         self, start: int = None, stop: int = None, extra_cells: list[int] = []
@@ -204,121 +342,126 @@ class CollectionSection:
         if start > stop:
             return
 
-        label = 0
+        # The Start to Stop passes and the extra cells run as one sequence,
+        # each pass draining fully before the next collector pass
+        passes = chain(range(start, stop), extra_cells)
+        for label, i in enumerate(passes):
+            self._run_on_cell(i, label)
 
-        for i in range(start, stop):
-            if stop is not None and i == stop:
-                break
+    def _run_on_cell(self, i: int, label: int):
+        self._apply_collector(i, label)
+        self._iterate_cells(label, i)
 
-            self._run_on_cell(i, str(label))
-            label += 1
+    def _apply_collector(self, i: int, pass_name: int):
+        sc = self.seed_cell
+        cv = self.collector
 
-        for i in extra_cells:
-            self._run_on_cell(i, label)
-            label += 1
+        mass_collected_pre_riser = self._get_sediment_mass(i)
+
+        # Take away proportion for the riser
+        mass_collected = mass_collected_pre_riser * (1 - cv.proportion_up_riser)
 
-    def _run_on_cell(self, i: int, label: str):
-        c = self.cells[i]
+        # Don't forget to settle some ON this cell
+        mass_to_settle = mass_collected * sc.sed_percent_to_settle
+        self._settle(i, mass_to_settle, pass_name, i)
 
-        c.apply_collector(self.collector, label, i)
-        self._iterate_cells(label, i)
+        mass_to_pass = mass_collected - mass_to_settle
+        self._pass_left[i] = mass_to_pass * sc.left_right_ratio
+        self._pass_right[i] = mass_to_pass - self._pass_left[i]
+
+    def _settle(self, i: int, mass: float, name: int, origin_cell: int):
+        settled_thickness = mass / self.seed_cell.sed_settled_density
+        self.beds[i].settle(settled_thickness, name, origin_cell)
+
+    def _get_sediment_mass(self, i: int):
+        # Get sediment mass taken by collector
+
+        # First get from the settled
+
+        cut_bed, cut_settled = self.beds[i].cut(
+            self.collector.cut_depth, self.collector.extra_settled_cut_depth
+        )
+
+        total_mass = (cut_settled * self.seed_cell.sed_settled_density) + (
+            cut_bed * self.seed_cell.sed_base_density
+        )
+
+        return total_mass
 
     def get_tops(self) -> Tuple[list, list]:
         # Get a list of settled tops and bed tops
-        settled_tops = [c.sediment_bed.settled_top for c in self.cells]
-        bed_tops = [c.sediment_bed.bed_top for c in self.cells]
+        settled_tops = [bed.settled_top for bed in self.beds]
+        bed_tops = [bed.bed_top for bed in self.beds]
         return settled_tops, bed_tops
 
     def get_sections(self) -> pd.DataFrame:
-        df_all = pd.DataFrame()
-        for i, cell in enumerate(self.cells):
-            df = cell.sediment_bed.bed_layers
-            df["cell_number"] = i
-
-            df_all = pd.concat([df_all, df], ignore_index=True)
-
-        df_all["thickness"] = abs(df_all["bottom"] - df_all["top"])
-        df_all['thickness2'] = df_all['thickness'] # hack because of the way px aggregates data, the original thickness is lost
-        total_thicknesses = df_all[df_all['type'] == 'settled'].groupby('cell_number').sum(numeric_only=True)['thickness2']
-        total_thicknesses = abs(total_thicknesses)
-        total_thicknesses.rename('total_thickness', inplace=True)
-        df_all = pd.merge(df_all, total_thicknesses, on='cell_number')
-
-        df_all["origin_cell"] = pd.to_numeric(df_all["origin_cell"], errors="coerce")
-        df_all["proximity"] = abs(df_all["origin_cell"] - df_all["cell_number"])
+        # Build each column in one go from the layers of every bed, rather
+        # than making a frame per cell and concatenating them
+        lengths = [len(bed.layers.tops) for bed in self.beds]
+        n_layers = sum(lengths)
+
+        def numeric_column(layers: str, dtype=np.float64) -> np.ndarray:
+            values = chain.from_iterable(
+                getattr(bed.layers, layers) for bed in self.beds
+            )
+            return np.fromiter(values, dtype=dtype, count=n_layers)
+
+        types = numeric_column("types", np.int8)
+
+        df_all = pd.DataFrame(
+            {
+                "top": numeric_column("tops"),
+                "bottom": numeric_column("bottoms"),
+                "type": pd.Categorical.from_codes(types, LAYER_TYPES),
+                "name": numeric_column("names"),
+                "origin_cell": numeric_column("origin_cells"),
+                "cell_number": np.repeat(np.arange(self.number_of_cells), lengths),
+            }
+        )
+
+        df_all["thickness"] = (df_all["bottom"] - df_all["top"]).abs()
+
+        # Broadcast each cell's total settled thickness to all its layers,
+        # leaving out cells with nothing settled on them
+        settled = pd.Series(types == TYPE_SETTLED)
+        cells = df_all["cell_number"]
+        df_all["total_thickness"] = (
+            df_all["thickness"].where(settled, 0.0).groupby(cells).transform("sum")
+        )
+        df_all = df_all[settled.groupby(cells).transform("any")]
+        df_all = df_all.reset_index(drop=True)
+
+        df_all["proximity"] = (df_all["origin_cell"] - df_all["cell_number"]).abs()
         
         
         
         return df_all
 
     def get_plotly_graph(self, color_by: Literal["name", "proximity"]) -> go.Figure:
-        df = self.get_sections()
-
-        if not color_by in ["name", "proximity"]:
-            raise ValueError("Unknown color by variable")
-
-        if color_by == "name":
-            df["name"] = pd.to_numeric(df["name"], errors="coerce")
-
-        fig = px.bar(
-            df,
-            x="cell_number",
-            y="thickness",
-            base="bottom",
-            color=color_by,
-            hover_name='cell_number',
-            hover_data={
-                'top': True,
-                'bottom': True,
-                'thickness': True, # For some reason thickness is displaying the wrong value (top)
-                'cell_number': True,
-                'name': True,
-                'thickness2': True,
-                'total_thickness': True
-            },
-        )
-        fig.update_layout(
-            bargap=0.0,
-            coloraxis_colorbar=dict(
-                title=color_by,
-            ),
-        )
-        fig.update_traces(hovertemplate="<b>Cell: %{hovertext}</b><br><br>Name=%{customdata[1]:.3f}<br>Top=%{y:.3f}<br>Bottom=%{base:.3f}<br>Thickness: %{customdata[2]:.3f}<br>Total thickness: %{customdata[3]:.3f}<br><extra></extra>")
-
-        fig.data[0].marker.line.width = 0
-
-        return fig
+        return plot_sections(self.get_sections(), color_by)
 
-    def _iterate_cells(self, pass_name: str, origin_cell: int):
+    def _iterate_cells(self, pass_name: int, origin_cell: int):
         # Pass over the cells until all the sediment has
         # settled or passed out of scope
 
-        passed_sediment = True
-        while passed_sediment:
-            passed_sediment = False
-            for i in range(self.number_of_cells):
-                cell = self.cells[i]
-                if cell.sed_to_pass_left > self.mass_lower_limit:
-                    passed_sediment = True
-
-                    if i != 0:
-                        self.cells[i - 1].add_sediment(
-                            cell.sed_to_pass_left, "left", pass_name, origin_cell
-                        )
-
-                    cell.sed_to_pass_left = 0.0
-
-                if cell.sed_to_pass_right > self.mass_lower_limit:
-                    passed_sediment = True
-
-                    try:
-                        self.cells[i + 1].add_sediment(
-                            cell.sed_to_pass_right, "right", pass_name, origin_cell
-                        )
-                    except IndexError:
-                        pass
+        n_events = drain_sediment(
+            self._pass_left,
+            self._pass_right,
+            origin_cell,
+            self.seed_cell.sed_percent_to_settle,
+            self.mass_lower_limit,
+            self._event_cells,
+            self._event_mass,
+        )
 
-                    cell.sed_to_pass_right = 0.0
+        # Add the settled layers to the beds outside the kernel, touching
+        # only the cells that were given sediment
+        cells = self._event_cells[:n_events].tolist()
+        thicknesses = (
+            self._event_mass[:n_events] / self.seed_cell.sed_settled_density
+        ).tolist()
+        for i, thickness in zip(cells, thicknesses):
+            self.beds[i].settle(thickness, pass_name, origin_cell)
 
 
 if __name__ == "__main__":
@@ -3,7 +3,17 @@ from unittest import TestCase
 import pandas as pd
 from pandas.testing import assert_frame_equal
 
-from collector_sed.sed_model import cut_sedbed, cut_settled_only
+from collector_sed.sed_model import (
+    LAYER_TYPES,
+    NO_VALUE,
+    SedimentBed,
+    cut_sedbed,
+    cut_settled_only,
+)
+
+
+def layer_types(*names):
+    return pd.Categorical(names, categories=LAYER_TYPES)
 
 
 class TestBedLayersCutting(TestCase):
@@ -16,177 +26,154 @@ class TestBedLayersCutting(TestCase):
     def test_cut_only_bed(self):
         CUT = 0.1
 
-        bed_layers = pd.DataFrame(
-            {
-                "top": [0.0],
-                "bottom": [-0.2],
-                "type": ["bed"],
-                "name": ["existing"],
-            }
-        )
+        bed = SedimentBed(bed_top=0.0, bed_bottom=-0.2)
 
         correct_layers = pd.DataFrame(
             {
                 "top": [0.0 - CUT],
                 "bottom": [-0.2],
-                "type": ["bed"],
-                "name": ["existing"],
+                "type": layer_types("bed"),
+                "name": [NO_VALUE],
+                "origin_cell": [NO_VALUE],
             }
         )
 
-        new_bed_layers, cut_bed, cut_settled = cut_sedbed(bed_layers, CUT)
+        cut_bed, cut_settled = cut_sedbed(bed.layers, CUT)
         self.assertAlmostEqual(cut_bed, CUT)
         self.assertAlmostEqual(cut_settled, 0.0)
-        assert_frame_equal(new_bed_layers, correct_layers)
+        assert_frame_equal(bed.to_dataframe(), correct_layers)
 
-        bed_layers = pd.DataFrame(
-            {
-                "top": [0.5],
-                "bottom": [-0.2],
-                "type": ["bed"],
-                "name": ["existing"],
-            }
-        )
+        bed = SedimentBed(bed_top=0.5, bed_bottom=-0.2)
 
         correct_layers = pd.DataFrame(
             {
                 "top": [0.5 - CUT],
                 "bottom": [-0.2],
-                "type": ["bed"],
-                "name": ["existing"],
+                "type": layer_types("bed"),
+                "name": [NO_VALUE],
+                "origin_cell": [NO_VALUE],
             }
         )
 
-        new_bed_layers, cut_bed, cut_settled = cut_sedbed(bed_layers, CUT)
+        cut_bed, cut_settled = cut_sedbed(bed.layers, CUT)
         self.assertAlmostEqual(cut_bed, CUT)
         self.assertAlmostEqual(cut_settled, 0.0)
-        assert_frame_equal(new_bed_layers, correct_layers)
+        assert_frame_equal(bed.to_dataframe(), correct_layers)
 
     def test_cut_with_one_settled(self):
         CUT = 0.1
 
-        bed_layers = pd.DataFrame(
-            {
-                "top": [0.2, 0.0],
-                "bottom": [0.0, -0.2],
-                "type": ["settled", "bed"],
-                "name": ["0", "existing"],
-            }
-        )
+        bed = SedimentBed(bed_top=0.0, bed_bottom=-0.2)
+        bed.settle(0.2, 0, 0)
 
         correct_layers = pd.DataFrame(
             {
                 "top": [0.1, 0.0],
                 "bottom": [0.0, -0.2],
-                "type": ["settled", "bed"],
-                "name": ["0", "existing"],
+                "type": layer_types("settled", "bed"),
+                "name": [0, NO_VALUE],
+                "origin_cell": [0, NO_VALUE],
             }
         )
 
-        new_bed_layers, cut_bed, cut_settled = cut_sedbed(bed_layers, CUT)
+        cut_bed, cut_settled = cut_sedbed(bed.layers, CUT)
         self.assertAlmostEqual(cut_bed, 0.0)
         self.assertAlmostEqual(cut_settled, CUT)
-        assert_frame_equal(new_bed_layers, correct_layers)
+        assert_frame_equal(bed.to_dataframe(), correct_layers)
 
-        bed_layers = pd.DataFrame(
-            {
-                "top": [-0.2, -0.5],
-                "bottom": [-0.5, -0.8],
-                "type": ["settled", "bed"],
-                "name": ["0", "existing"],
-            }
-        )
+        bed = SedimentBed(bed_top=-0.5, bed_bottom=-0.8)
+        bed.settle(0.3, 0, 0)
 
         correct_layers = pd.DataFrame(
             {
                 "top": [-0.2 - CUT, -0.5],
                 "bottom": [-0.5, -0.8],
-                "type": ["settled", "bed"],
-                "name": ["0", "existing"],
+                "type": layer_types("settled", "bed"),
+                "name": [0, NO_VALUE],
+                "origin_cell": [0, NO_VALUE],
             }
         )
 
-        new_bed_layers, cut_bed, cut_settled = cut_sedbed(bed_layers, CUT)
+        cut_bed, cut_settled = cut_sedbed(bed.layers, CUT)
         self.assertAlmostEqual(cut_bed, 0.0)
         self.assertAlmostEqual(cut_settled, CUT)
-        assert_frame_equal(new_bed_layers, correct_layers)
+        assert_frame_equal(bed.to_dataframe(), correct_layers)
 
     def test_cut_with_multiple_settled(self):
         CUT = 0.1
 
-        bed_layers = pd.DataFrame(
-            {
-                "top": [0.5, 0.4, 0.2, 0.0],
-                "bottom": [0.4, 0.2, 0.0, -0.5],
-                "type": ["settled", "settled", "settled", "bed"],
-                "name": ["2", "1", "0", "existing"],
-            }
-        )
+        bed = SedimentBed(bed_top=0.0, bed_bottom=-0.5)
+        bed.settle(0.2, 0, 0)
+        bed.settle(0.2, 1, 0)
+        bed.settle(0.1, 2, 0)
 
         correct_layers = pd.DataFrame(
             {
                 "top": [0.4, 0.2, 0.0],
                 "bottom": [0.2, 0.0, -0.5],
-                "type": ["settled", "settled", "bed"],
-                "name": ["1", "0", "existing"],
+                "type": layer_types("settled", "settled", "bed"),
+                "name": [1, 0, NO_VALUE],
+                "origin_cell": [0, 0, NO_VALUE],
             }
         )
 
-        new_bed_layers, cut_bed, cut_settled = cut_sedbed(bed_layers, CUT)
+        cut_bed, cut_settled = cut_sedbed(bed.layers, CUT)
         self.assertAlmostEqual(cut_bed, 0.0)
         self.assertAlmostEqual(cut_settled, CUT)
-        assert_frame_equal(new_bed_layers, correct_layers)
+        assert_frame_equal(bed.to_dataframe(), correct_layers)
+
+    def test_cut_through_bed(self):
+        CUT = 0.3
+
+        bed = SedimentBed(bed_top=0.0, bed_bottom=-0.2)
+
+        cut_bed, cut_settled = cut_sedbed(bed.layers, CUT)
+        self.assertAlmostEqual(cut_bed, CUT)
+        self.assertAlmostEqual(cut_settled, 0.0)
+        self.assertEqual(len(bed.layers.tops), 1)
+        self.assertAlmostEqual(bed.layers.tops[0], -CUT)
 
 class TestCutSettled(TestCase):
     def test_cut_with_multiple_settled(self):
         CUT = 0.1
 
-        bed_layers = pd.DataFrame(
-            {
-                "top": [0.5, 0.38, 0.2, 0.0],
-                "bottom": [0.38, 0.2, 0.0, -0.5],
-                "type": ["settled", "settled", "settled", "bed"],
-                "name": ["2", "1", "0", "existing"],
-            }
-        )
+        bed = SedimentBed(bed_top=0.0, bed_bottom=-0.5)
+        bed.settle(0.2, 0, 0)
+        bed.settle(0.18, 1, 0)
+        bed.settle(0.12, 2, 0)
 
         correct_layers = pd.DataFrame(
             {
                 "top": [0.4, 0.38, 0.2, 0.0],
                 "bottom": [0.38, 0.2, 0.0, -0.5],
-                "type": ["settled", "settled", "settled", "bed"],
-                "name": ["2", "1", "0", "existing"],
+                "type": layer_types("settled", "settled", "settled", "bed"),
+                "name": [2, 1, 0, NO_VALUE],
+                "origin_cell": [0, 0, 0, NO_VALUE],
             }
         )
 
-        new_bed_layers, cut_settled = cut_settled_only(bed_layers, CUT)
+        cut_settled = cut_settled_only(bed.layers, CUT)
         self.assertAlmostEqual(cut_settled, CUT)
-        assert_frame_equal(new_bed_layers, correct_layers)
-        
-        
+        assert_frame_equal(bed.to_dataframe(), correct_layers)
+
+
     def test_cut_with_thin_settled(self):
-        
+
         CUT = 0.1
-        
-        bed_layers = pd.DataFrame(
-            {
-                "top": [0.0245, 0.0],
-                "bottom": [0.0, -0.5],
-                "type": ["settled", "bed"],
-                "name": ["0", "existing"],
-            }
-        )
+
+        bed = SedimentBed(bed_top=0.0, bed_bottom=-0.5)
+        bed.settle(0.0245, 0, 0)
 
         correct_layers = pd.DataFrame(
             {
                 "top": [0.0],
                 "bottom": [-0.5],
-                "type": ["bed"],
-                "name": ["existing"],
+                "type": layer_types("bed"),
+                "name": [NO_VALUE],
+                "origin_cell": [NO_VALUE],
             }
         )
 
-        new_bed_layers, cut_settled = cut_settled_only(bed_layers, CUT)
+        cut_settled = cut_settled_only(bed.layers, CUT)
         self.assertAlmostEqual(cut_settled, 0.0245)
-        assert_frame_equal(new_bed_layers, correct_layers)
-        
\ No newline at end of file
+        assert_frame_equal(bed.to_dataframe(), correct_layers)
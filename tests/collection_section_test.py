@@ -0,0 +1,227 @@
+from unittest import TestCase
+
+import pandas as pd
+from pandas.testing import assert_frame_equal
+
+from collector_sed.sed_model import (
+    NO_VALUE,
+    CollectionSection,
+    CollectorParams,
+    SedCell,
+    SedimentBed,
+)
+
+START = 2
+STOP = 6
+# Passes over both edge cells and again over a cell already cut
+EXTRA_CELLS = [0, 7, 4]
+
+
+def make_section(
+    left_right_ratio, extra_settled_cut_depth=None, mass_lower_limit=0.01
+):
+    return CollectionSection(
+        seed_cell=SedCell(
+            left_right_ratio=left_right_ratio,
+            sed_settled_density=120.0,
+            sed_base_density=350.0,
+            sed_percent_to_settle=0.5,
+        ),
+        number_of_cells=8,
+        collector=CollectorParams(
+            cut_depth=0.1,
+            proportion_up_riser=0.2,
+            extra_settled_cut_depth=extra_settled_cut_depth,
+        ),
+        mass_lower_limit=mass_lower_limit,
+    )
+
+
+class TestCollectionSectionTransport(TestCase):
+    # Expected layers are (tops, names, origin cells) for each cell from the
+    # top down, as given by the original pandas model for the same run
+
+    def assertLayers(self, section, expected):
+        self.assertEqual(len(section.beds), len(expected))
+
+        for cell, (tops, names, origin_cells) in enumerate(expected):
+            correct_layers = pd.DataFrame(
+                {"top": tops, "name": names, "origin_cell": origin_cells}
+            )
+            layers = section.beds[cell].to_dataframe()
+            with self.subTest(cell=cell):
+                assert_frame_equal(
+                    layers[["top", "name", "origin_cell"]],
+                    correct_layers,
+                    check_dtype=False,
+                    atol=1e-6,
+                )
+
+    def test_all_passed_right(self):
+        section = make_section(0.0)
+        section.run_model(START, STOP, EXTRA_CELLS)
+
+        self.assertLayers(
+            section,
+            [
+                ([0.016667, -0.1], [4, NO_VALUE], [0, NO_VALUE]),
+                ([0.058333, 0.0], [4, NO_VALUE], [0, NO_VALUE]),
+                ([0.045833, 0.016667, -0.1], [4, 0, NO_VALUE], [0, 2, NO_VALUE]),
+                (
+                    [0.044861, 0.030278, -0.041667],
+                    [4, 1, NO_VALUE],
+                    [0, 3, NO_VALUE],
+                ),
+                ([-0.000923, -0.060843], [6, NO_VALUE], [4, NO_VALUE]),
+                (
+                    [0.065656, 0.035697, 0.032051, -0.034067],
+                    [6, 4, 3, NO_VALUE],
+                    [4, 0, 5, NO_VALUE],
+                ),
+                (
+                    [0.082828, 0.067848, 0.066026, 0.032966, 0.016285, 0.007292, 0.0],
+                    [6, 4, 3, 2, 1, 0, NO_VALUE],
+                    [4, 0, 5, 4, 3, 2, NO_VALUE],
+                ),
+                (
+                    [0.032072, 0.024582, -0.066076],
+                    [6, 5, NO_VALUE],
+                    [4, 7, NO_VALUE],
+                ),
+            ],
+        )
+
+    def test_passed_both_ways(self):
+        section = make_section(0.5)
+        section.run_model(START, STOP, EXTRA_CELLS)
+
+        self.assertLayers(
+            section,
+            [
+                (
+                    [0.024035, 0.022785, 0.022393, -0.075458],
+                    [6, 5, 4, NO_VALUE],
+                    [4, 7, 0, NO_VALUE],
+                ),
+                (
+                    [0.07683, 0.07433, 0.073546, 0.049083, 0.046418, 0.040955, 0.029167, 0.0],
+                    [6, 5, 4, 3, 2, 1, 0, NO_VALUE],
+                    [4, 7, 0, 5, 4, 3, 2, NO_VALUE],
+                ),
+                (
+                    [0.075299, 0.070299, 0.068731, 0.0565, 0.051169, 0.040243, 0.016667, -0.1],
+                    [6, 5, 4, 3, 2, 1, 0, NO_VALUE],
+                    [4, 7, 0, 5, 4, 3, 2, NO_VALUE],
+                ),
+                (
+                    [0.075237, 0.065237, 0.062101, 0.055986, 0.045325, 0.023472, -0.070833],
+                    [6, 5, 4, 3, 2, 1, NO_VALUE],
+                    [4, 7, 0, 5, 4, 3, NO_VALUE],
+                ),
+                (
+                    [-0.003778, -0.043778, -0.06184],
+                    [6, 2, NO_VALUE],
+                    [4, 4, NO_VALUE],
+                ),
+                (
+                    [0.050291, 0.040291, 0.027747, 0.026218, -0.059067],
+                    [6, 5, 4, 3, NO_VALUE],
+                    [4, 7, 0, 5, NO_VALUE],
+                ),
+                (
+                    [0.072641, 0.067641, 0.042552, 0.041788, 0.020466, 0.00954, 0.003646, 0.0],
+                    [6, 5, 4, 3, 2, 1, 0, NO_VALUE],
+                    [4, 7, 0, 5, 4, 3, 2, NO_VALUE],
+                ),
+                (
+                    [0.024131, 0.021631, -0.078724],
+                    [6, 5, NO_VALUE],
+                    [4, 7, NO_VALUE],
+                ),
+            ],
+        )
+
+    def test_all_passed_left(self):
+        section = make_section(1.0)
+        section.run_model(START, STOP, EXTRA_CELLS)
+
+        self.assertLayers(
+            section,
+            [
+                (
+                    [0.032839, 0.030339, 0.029427, -0.045313],
+                    [6, 5, 4, NO_VALUE],
+                    [4, 7, 0, NO_VALUE],
+                ),
+                (
+                    [0.116198, 0.111198, 0.109375, 0.102083, 0.0875, 0.058333, 0.0],
+                    [6, 5, 3, 2, 1, 0, NO_VALUE],
+                    [4, 7, 5, 4, 3, 2, NO_VALUE],
+                ),
+                (
+                    [0.132396, 0.122396, 0.11875, 0.104167, 0.075, 0.016667, -0.1],
+                    [6, 5, 3, 2, 1, 0, NO_VALUE],
+                    [4, 7, 5, 4, 3, 2, NO_VALUE],
+                ),
+                (
+                    [0.131458, 0.111458, 0.104167, 0.075, 0.016667, -0.1],
+                    [6, 5, 3, 2, 1, NO_VALUE],
+                    [4, 7, 5, 4, 3, NO_VALUE],
+                ),
+                ([0.029583, -0.010417, -0.1], [6, 2, NO_VALUE], [4, 4, NO_VALUE]),
+                ([0.045833, 0.016667, -0.1], [5, 3, NO_VALUE], [7, 5, NO_VALUE]),
+                ([0.058333, 0.0], [5, NO_VALUE], [7, NO_VALUE]),
+                ([0.016667, -0.1], [5, NO_VALUE], [7, NO_VALUE]),
+            ],
+        )
+
+    def test_stops_at_mass_lower_limit(self):
+        # A high lower limit stops each stream a few cells out, and the
+        # extra settled cut takes some of what earlier passes left
+        section = make_section(0.5, extra_settled_cut_depth=0.05, mass_lower_limit=5.0)
+        section.run_model(START, STOP, EXTRA_CELLS)
+
+        self.assertLayers(
+            section,
+            [
+                ([0.016667, -0.1], [4, NO_VALUE], [0, NO_VALUE]),
+                ([0.058333, 0.029167, 0.0], [4, 0, NO_VALUE], [0, 2, NO_VALUE]),
+                ([0.04875, 0.016667, -0.1], [1, 0, NO_VALUE], [3, 2, NO_VALUE]),
+                ([0.060708, 0.028333, -0.1], [2, 1, NO_VALUE], [4, 3, NO_VALUE]),
+                (
+                    [-0.028096, -0.088096, -0.1],
+                    [6, 2, NO_VALUE],
+                    [4, 4, NO_VALUE],
+                ),
+                ([0.029617, -0.1], [3, NO_VALUE], [5, NO_VALUE]),
+                ([0.061571, 0.032404, 0.0], [5, 3, NO_VALUE], [7, 5, NO_VALUE]),
+                ([0.016667, -0.1], [5, NO_VALUE], [7, NO_VALUE]),
+            ],
+        )
+
+
+class TestCollectionSectionReset(TestCase):
+    def test_reset_matches_new_section(self):
+        section = make_section(0.5, extra_settled_cut_depth=0.05)
+        section.run_model(START, STOP, EXTRA_CELLS)
+
+        section.reset()
+        section.run_model(1, 5, [6, 2])
+
+        new_section = make_section(0.5, extra_settled_cut_depth=0.05)
+        new_section.run_model(1, 5, [6, 2])
+
+        assert_frame_equal(section.get_sections(), new_section.get_sections())
+        self.assertEqual(section.get_tops(), new_section.get_tops())
+
+    def test_bed_reset_matches_fresh_copy(self):
+        seed = SedimentBed(bed_top=0.1, bed_bottom=-0.3, settled_top=0.05)
+
+        bed = seed.fresh_copy()
+        bed.settle(0.2, 0, 0)
+        bed.cut(0.1, 0.05)
+        bed.reset()
+
+        fresh = seed.fresh_copy()
+        self.assertEqual(bed.settled_top, fresh.settled_top)
+        assert_frame_equal(bed.to_dataframe(), fresh.to_dataframe())